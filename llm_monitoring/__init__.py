@@ -10,7 +10,7 @@ A monitoring wrapper for LLM API calls with:
 from .monitor import LLMMonitor
 from .providers import MockLLMProvider, MockOpenAIProvider, MockAnthropicProvider
 from .metrics import MetricsCollector, RequestMetrics
-from .circuit_breaker import CircuitBreaker, CircuitState
+from .circuit_breaker import Admission, CircuitBreaker, CircuitState
 
 __all__ = [
     'LLMMonitor',
@@ -20,6 +20,7 @@ __all__ = [
     'MetricsCollector',
     'RequestMetrics',
     'CircuitBreaker',
-    'CircuitState'
+    'CircuitState',
+    'Admission'
 ]
 
@@ -4,7 +4,8 @@ Circuit Breaker implementation for provider failover.
 
 from enum import Enum
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
+import threading
 import time
 
 
@@ -15,6 +16,16 @@ class CircuitState(Enum):
     HALF_OPEN = "half_open"  # Testing if recovered #Half-open state is used to test if the provider has recovered from the failure.
 
 
+class Admission(Enum):
+    """Result of CircuitBreaker.try_acquire(); truthy when the request may be sent."""
+    REFUSED = "refused"  # Circuit open or a recovery probe is already in flight
+    ADMITTED = "admitted"  # Normal request through a closed circuit
+    PROBE = "probe"  # The single half-open recovery probe
+    
+    def __bool__(self) -> bool:
+        return self is not Admission.REFUSED
+
+
 @dataclass
 class CircuitBreaker:
     """Circuit breaker for provider failover."""
@@ -24,10 +35,14 @@ class CircuitBreaker:
     recovery_timeout_seconds: int = 30 #Auto-recovery after 30 seconds (half-open state)
     
     def __init__(self, failure_threshold: int = 5, error_rate_threshold: float = 0.5, 
-                 recovery_timeout_seconds: int = 30):
+                 recovery_timeout_seconds: int = 30,
+                 on_state_change: Optional[Callable[[CircuitState], None]] = None):
         self.failure_threshold = failure_threshold
         self.error_rate_threshold = error_rate_threshold
         self.recovery_timeout_seconds = recovery_timeout_seconds
+        # Called with the current state after every transition, outside the
+        # breaker's lock; may repeat a state if transitions race
+        self.on_state_change = on_state_change
         
         self.state = CircuitState.CLOSED
         self.failure_count = 0
@@ -35,62 +50,166 @@ class CircuitBreaker:
         self.total_requests = 0
         self.last_failure_time: Optional[float] = None
         self.opened_at: Optional[float] = None
+        
+        # Only one recovery probe may be in flight while half-open; a claim
+        # older than recovery_timeout_seconds counts as lost and is dropped
+        self._probe_claimed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        
+        # Transitions happen under _lock but are reported after releasing it,
+        # so on_state_change may call back into the breaker
+        self._state_changed = False
+        self._notify_lock = threading.RLock()
+    
+    def _set_state(self, state: CircuitState):
+        # Caller holds _lock and must call _notify() once it is released
+        self.state = state
+        self._state_changed = True
+    
+    def _notify(self):
+        if not self._state_changed or self.on_state_change is None:
+            return
+        with self._notify_lock:
+            # Report the state as of now, so the last callback always sees the
+            # latest transition even if notifications from racing threads interleave
+            self._state_changed = False
+            self.on_state_change(self.state)
+    
+    def _is_probe(self, probe: Optional[bool]) -> bool:
+        # Only the admitted recovery probe settles a half-open circuit; callers
+        # that don't say (probe=None) are treated as the probe, as before
+        return self.state is CircuitState.HALF_OPEN and probe is not False
+    
+    def _probe_in_flight(self, now: float) -> bool:
+        claimed_at = self._probe_claimed_at
+        return claimed_at is not None and (now - claimed_at) < self.recovery_timeout_seconds
     
-    def record_success(self):
-        """Record a successful request."""
-        self.success_count += 1
-        self.total_requests += 1
-        
-        if self.state == CircuitState.HALF_OPEN:
-            # If we get a success in half-open, close the circuit
-            self.state = CircuitState.CLOSED
-            self.failure_count = 0
-            self.opened_at = None
+    def _check_half_open(self, now: Optional[float]) -> bool:
+        """Move OPEN -> HALF_OPEN once the recovery timeout has passed; True if a probe may go."""
+        if now is None:
+            now = time.time()
+        
+        if self.state is CircuitState.OPEN:
+            # Check if recovery timeout has passed
+            if not (self.opened_at and (now - self.opened_at) >= self.recovery_timeout_seconds):
+                return False
+            self._set_state(CircuitState.HALF_OPEN)
+        
+        return not self._probe_in_flight(now)
     
-    def record_failure(self):
-        """Record a failed request."""
-        self.failure_count += 1
-        self.total_requests += 1
-        self.last_failure_time = time.time()
-        
-        # Check if we should open the circuit
-        if self.state == CircuitState.CLOSED:
-            error_rate = self.failure_count / self.total_requests if self.total_requests > 0 else 0
+    def record_success(self, probe: Optional[bool] = None):
+        """
+        Record a successful request.
+        
+        Args:
+            probe: Whether try_acquire() admitted this request as Admission.PROBE
+        """
+        with self._lock:
+            self.success_count += 1
+            self.total_requests += 1
+            
+            if self._is_probe(probe):
+                # If the probe succeeds in half-open, close the circuit
+                self._probe_claimed_at = None
+                self._set_state(CircuitState.CLOSED)
+                self.failure_count = 0
+                self.opened_at = None
+        self._notify()
+    
+    def record_failure(self, now: Optional[float] = None, probe: Optional[bool] = None):
+        """
+        Record a failed request.
+        
+        Args:
+            now: Current time.time() reading, fetched here if not given
+            probe: Whether try_acquire() admitted this request as Admission.PROBE
+        """
+        if now is None:
+            now = time.time()
+        
+        with self._lock:
+            self.failure_count += 1
+            self.total_requests += 1
+            self.last_failure_time = now
             
-            if (self.failure_count >= self.failure_threshold or 
-                error_rate >= self.error_rate_threshold):
-                self.state = CircuitState.OPEN
-                self.opened_at = time.time()
+            # Check if we should open the circuit
+            if self.state is CircuitState.CLOSED:
+                error_rate = self.failure_count / self.total_requests if self.total_requests > 0 else 0
+                
+                if (self.failure_count >= self.failure_threshold or 
+                    error_rate >= self.error_rate_threshold):
+                    self._set_state(CircuitState.OPEN)
+                    self.opened_at = now
+            elif self._is_probe(probe):
+                # Recovery probe failed, reopen the circuit
+                self._probe_claimed_at = None
+                self._set_state(CircuitState.OPEN)
+                self.opened_at = now
+        self._notify()
     
-    def can_attempt(self) -> bool:
+    def release_probe(self):
+        """Give back the half-open probe slot without recording an outcome."""
+        with self._lock:
+            self._probe_claimed_at = None
+    
+    def try_acquire(self, now: Optional[float] = None) -> Admission:
         """
-        Check if we can attempt a request.
+        Ask to send a request through this breaker, claiming the half-open
+        probe slot if that is what the request will be.
+        
+        Args:
+            now: Current time.time() reading, fetched here if not given
         
         Returns:
-            True if we should try, False if circuit is open
+            Admission (truthy unless REFUSED); pass ``admission is
+            Admission.PROBE`` back to record_success()/record_failure() as
+            ``probe``, or call release_probe() if the probe is abandoned
         """
-        if self.state == CircuitState.CLOSED:
-            return True
+        if self.state is CircuitState.CLOSED:
+            return Admission.ADMITTED
         
-        if self.state == CircuitState.OPEN:
-            # Check if recovery timeout has passed
-            if self.opened_at and (time.time() - self.opened_at) >= self.recovery_timeout_seconds:
-                self.state = CircuitState.HALF_OPEN
-                return True
-            return False
+        with self._lock:
+            if self.state is CircuitState.CLOSED:
+                return Admission.ADMITTED
+            
+            if now is None:
+                now = time.time()
+            
+            # Admit a single probe; everyone else waits for its outcome
+            admitted = self._check_half_open(now)
+            if admitted:
+                self._probe_claimed_at = now
+        self._notify()
         
-        if self.state == CircuitState.HALF_OPEN:
+        return Admission.PROBE if admitted else Admission.REFUSED
+    
+    def can_attempt(self, now: Optional[float] = None) -> bool:
+        """
+        Check if we can attempt a request, without claiming the probe slot.
+        
+        Args:
+            now: Current time.time() reading, fetched here if not given
+        
+        Returns:
+            True if we should try, False if circuit is open or a
+            half-open recovery probe is already in flight
+        """
+        if self.state is CircuitState.CLOSED:
             return True
         
-        return False
+        with self._lock:
+            allowed = self.state is CircuitState.CLOSED or self._check_half_open(now)
+        self._notify()
+        
+        return allowed
     
     def get_state(self) -> CircuitState:
-        """Get current circuit state."""
-        # Auto-transition from OPEN to HALF_OPEN if timeout passed
-        if self.state == CircuitState.OPEN and self.opened_at:
-            if (time.time() - self.opened_at) >= self.recovery_timeout_seconds:
-                self.state = CircuitState.HALF_OPEN
+        """
+        Get current circuit state without side effects.
         
+        The OPEN -> HALF_OPEN transition only happens in can_attempt() and
+        try_acquire(), when a caller actually wants to send a request.
+        """
         return self.state
     
     def get_stats(self) -> dict:
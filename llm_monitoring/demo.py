@@ -2,6 +2,7 @@
 Demo script showing the monitoring system in action.
 """
 
+import asyncio
 import time
 import sys
 import os
@@ -12,6 +13,17 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from llm_monitoring.monitor import LLMMonitor
 
 
+async def run_concurrently(monitor, requests, max_concurrency=4):
+    """Issue independent requests concurrently, respecting a concurrency cap."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(req):
+        async with semaphore:
+            return await monitor.generate_async(**req)
+    
+    return await asyncio.gather(*(run(req) for req in requests), return_exceptions=True)
+
+
 def main():
     """Run a demonstration of the monitoring system."""
     
@@ -46,18 +58,17 @@ def main():
         },
     ]
     
-    # Make requests
-    for i, req in enumerate(requests, 1):
+    # Make requests (they are independent, so issue them concurrently)
+    results = asyncio.run(run_concurrently(monitor, requests))
+    
+    for i, (req, result) in enumerate(zip(requests, results), 1):
         print(f"Request {i}: {req['prompt'][:50]}...")
-        try:
-            response = monitor.generate(**req)
-            print(f"  [OK] Success: {response.content[:60]}...")
-            print(f"  Tokens: {response.input_tokens} in, {response.output_tokens} out")
-            print(f"  Latency: {response.latency_ms:.0f}ms\n")
-        except Exception as e:
-            print(f"  [ERROR] Error: {e}\n")
-        
-        time.sleep(0.5)  # Small delay between requests
+        if isinstance(result, Exception):
+            print(f"  [ERROR] Error: {result}\n")
+        else:
+            print(f"  [OK] Success: {result.content[:60]}...")
+            print(f"  Tokens: {result.input_tokens} in, {result.output_tokens} out")
+            print(f"  Latency: {result.latency_ms:.0f}ms\n")
     
     # Simulate some failures to test circuit breaker
     print("Simulating failures to test circuit breaker...\n")
@@ -82,12 +93,16 @@ def main():
     # Print final statistics
     monitor.print_stats()
     
+    # Make sure queued telemetry reaches the log file before exiting
+    monitor.close()
+    
     # Show some log entries
     print("\nSample Telemetry Log Entries:")
     print("-" * 60)
     if monitor.log_buffer:
         import json
-        for entry in monitor.log_buffer[:3]:
+        from itertools import islice
+        for entry in islice(monitor.log_buffer, 3):
             print(json.dumps(entry, indent=2))
             print()
 
@@ -4,6 +4,11 @@ Metrics collection and aggregation.
 
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
+from array import array
+from itertools import accumulate
+import bisect
+import math
+import threading
 import time
 from collections import defaultdict
 
@@ -27,77 +32,138 @@ class RequestMetrics:
     variant_id: Optional[str] = None
 
 
+class LatencyHistogram:
+    """
+    Latency distribution in fixed log-spaced buckets.
+    
+    Memory is constant (4096 uint32 counts) however many samples are added,
+    and percentiles come from a prefix sum over the buckets. Bucket width is
+    ~0.4% of the value, covering latencies up to several hours.
+    """
+    
+    BUCKETS = 4096
+    SCALE = 256  # buckets per unit of log1p(latency_ms)
+    
+    def __init__(self):
+        self.counts = array('I', [0]) * self.BUCKETS
+        self.count = 0
+        self.min = float("inf")
+        self.max = 0.0
+    
+    def add(self, latency_ms: float):
+        """Add an observation."""
+        bucket = int(math.log1p(max(latency_ms, 0.0)) * self.SCALE)
+        self.counts[min(bucket, self.BUCKETS - 1)] += 1
+        self.count += 1
+        if latency_ms < self.min:
+            self.min = latency_ms
+        if latency_ms > self.max:
+            self.max = latency_ms
+    
+    def percentiles(self, *ps: float) -> List[float]:
+        """Values at the given quantiles (0-1), clamped to the observed range."""
+        n = self.count
+        if not n:
+            return [0.0] * len(ps)
+        
+        cumulative = list(accumulate(self.counts))
+        values = []
+        for p in ps:
+            # Same rank as indexing a sorted list at int(n * p)
+            bucket = bisect.bisect_left(cumulative, min(int(n * p), n - 1) + 1)
+            value = math.expm1((bucket + 0.5) / self.SCALE)
+            values.append(min(max(value, self.min), self.max))
+        return values
+
+
+@dataclass(slots=True)
+class ProviderStats:
+    """Running aggregates for a single provider."""
+    total_requests: int = 0
+    successful_requests: int = 0
+    failed_requests: int = 0
+    total_tokens: int = 0
+    total_cost: float = 0.0
+    latency_sum: float = 0.0
+    latencies: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
 class MetricsCollector:
     """Collects and aggregates metrics."""
     
     def __init__(self):
-        self.metrics: List[RequestMetrics] = []
-        self.provider_stats: Dict[str, Dict] = defaultdict(lambda: {
-            "total_requests": 0,
-            "successful_requests": 0,
-            "failed_requests": 0,
-            "total_tokens": 0,
-            "total_cost": 0.0,
-            "latencies": []
-        })
+        # Only aggregates are kept, so memory does not grow with request count
+        self.total_requests = 0
+        self.provider_stats: Dict[str, ProviderStats] = defaultdict(ProviderStats)
+        self._lock = threading.Lock()
     
     def record(self, metrics: RequestMetrics):
         """Record metrics for a request."""
-        self.metrics.append(metrics)
-        
-        stats = self.provider_stats[metrics.provider]
-        stats["total_requests"] += 1
-        stats["total_tokens"] += metrics.total_tokens
-        stats["total_cost"] += metrics.cost_usd
-        stats["latencies"].append(metrics.latency_ms)
-        
-        if metrics.success:
-            stats["successful_requests"] += 1
-        else:
-            stats["failed_requests"] += 1
+        with self._lock:
+            self.total_requests += 1
+            
+            stats = self.provider_stats[metrics.provider]
+            stats.total_requests += 1
+            stats.total_tokens += metrics.total_tokens
+            stats.total_cost += metrics.cost_usd
+            
+            stats.latency_sum += metrics.latency_ms
+            stats.latencies.add(metrics.latency_ms)
+            
+            if metrics.success:
+                stats.successful_requests += 1
+            else:
+                stats.failed_requests += 1
     
     def get_provider_stats(self, provider: str) -> Dict:
         """Get aggregated statistics for a provider."""
+        with self._lock:
+            return self._provider_stats_locked(provider)
+    
+    def _provider_stats_locked(self, provider: str) -> Dict:
         if provider not in self.provider_stats:
             return {}
         
         stats = self.provider_stats[provider]
-        latencies = stats["latencies"]
-        
-        if not latencies:
-            return stats
-        
-        latencies_sorted = sorted(latencies)
-        n = len(latencies_sorted)
+        n = stats.total_requests
+        latencies = stats.latencies
+        p50, p95, p99 = latencies.percentiles(0.50, 0.95, 0.99)
         
         return {
-            **stats,
-            "latency_p50": latencies_sorted[n // 2] if n > 0 else 0,
-            "latency_p95": latencies_sorted[int(n * 0.95)] if n > 1 else latencies_sorted[0],
-            "latency_p99": latencies_sorted[int(n * 0.99)] if n > 1 else latencies_sorted[0],
-            "error_rate": stats["failed_requests"] / stats["total_requests"] if stats["total_requests"] > 0 else 0,
-            "avg_latency": sum(latencies) / len(latencies),
-            "min_latency": min(latencies),
-            "max_latency": max(latencies)
+            "total_requests": n,
+            "successful_requests": stats.successful_requests,
+            "failed_requests": stats.failed_requests,
+            "total_tokens": stats.total_tokens,
+            "total_cost": stats.total_cost,
+            "latency_p50": p50,
+            "latency_p95": p95,
+            "latency_p99": p99,
+            "error_rate": stats.failed_requests / n if n > 0 else 0,
+            "avg_latency": stats.latency_sum / n if n > 0 else 0,
+            "min_latency": latencies.min if n > 0 else 0,
+            "max_latency": latencies.max
         }
     
     def get_all_stats(self) -> Dict[str, Dict]:
         """Get statistics for all providers."""
-        return {
-            provider: self.get_provider_stats(provider)
-            for provider in self.provider_stats.keys()
-        }
+        with self._lock:
+            return {
+                provider: self._provider_stats_locked(provider)
+                for provider in self.provider_stats.keys()
+            }
     
     def get_total_cost(self) -> float:
         """Get total cost across all providers."""
-        return sum(stats["total_cost"] for stats in self.provider_stats.values())
+        with self._lock:
+            return sum(stats.total_cost for stats in self.provider_stats.values())
     
     def get_total_requests(self) -> int:
         """Get total number of requests."""
-        return len(self.metrics)
+        return self.total_requests
     
     def clear(self):
         """Clear all metrics (useful for testing)."""
-        self.metrics.clear()
-        self.provider_stats.clear()
+        with self._lock:
+            self.total_requests = 0
+            self.provider_stats.clear()
 
@@ -2,21 +2,41 @@
 Main monitoring wrapper for LLM API calls.
 """
 
+import asyncio
+import atexit
+import functools
+import io
+import itertools
 import json
+import logging
+import queue
+import secrets
+import sys
+import threading
 import time
-import uuid
-from typing import Optional, Dict, Any
+from collections import deque
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime
 
+try:
+    import orjson  # Optional: faster telemetry serialization
+except ImportError:
+    orjson = None
+
 from .providers import MockLLMProvider, MockOpenAIProvider, MockAnthropicProvider, LLMResponse
-from .circuit_breaker import CircuitBreaker, CircuitState
+from .circuit_breaker import Admission, CircuitBreaker, CircuitState
 from .metrics import MetricsCollector, RequestMetrics
 
+logger = logging.getLogger(__name__)
+
+# Queue sentinel telling a background drainer thread to exit
+_STOP = object()
+
 
 class LLMMonitor:
  
     
-    def __init__(self, log_file: Optional[str] = None):
+    def __init__(self, log_file: Optional[str] = None, log_buffer_size: int = 10_000):
      
         # Initialize providers
         self.providers: Dict[str, MockLLMProvider] = {
@@ -24,18 +44,53 @@ class LLMMonitor:
             "anthropic": MockAnthropicProvider()
         }
         
-        # Initialize circuit breakers
+        # Per-token (input, output) prices, resolved once instead of per request
+        self._cost_rates: Dict[str, Tuple[float, float]] = {
+            provider_id: (getattr(p, 'cost_per_1k_input', 0.0) / 1000,
+                          getattr(p, 'cost_per_1k_output', 0.0) / 1000)
+            for provider_id, p in self.providers.items()
+        }
+        
+        # Initialize circuit breakers; each keeps its bit in _available_mask
+        # (set while its circuit is closed) up to date on state changes
+        self._provider_list = list(self.providers.keys())
+        self._available_mask = (1 << len(self._provider_list)) - 1
+        self._mask_lock = threading.Lock()
         self.circuit_breakers: Dict[str, CircuitBreaker] = {
-            provider_id: CircuitBreaker()
-            for provider_id in self.providers.keys()
+            provider_id: CircuitBreaker(
+                on_state_change=functools.partial(self._on_breaker_state_change, 1 << i)
+            )
+            for i, provider_id in enumerate(self._provider_list)
         }
         
         # Metrics collector
         self.metrics = MetricsCollector()
         
+        # Request IDs: random per-monitor prefix + counter, no urandom read per request
+        self._id_prefix = secrets.token_hex(8)
+        self._id_counter = itertools.count()
+        
+        # (epoch second, ISO string) so timestamps are formatted at most once per second
+        self._ts_cache = (0, "")
+        
         # Logging
         self.log_file = log_file
-        self.log_buffer: list = []
+        # Keeps only the most recent entries so long-running monitors use constant memory
+        self.log_buffer: deque = deque(maxlen=log_buffer_size)
+        
+        # File writes happen on a background thread, off the request path,
+        # through one long-lived buffered handle
+        self._log_queue: queue.Queue = queue.Queue(maxsize=10_000)
+        self._log_fh = None
+        self._log_thread: Optional[threading.Thread] = None
+        self.telemetry_write_errors = 0
+        if log_file:
+            self._log_fh = open(log_file, 'ab', buffering=1 << 16)
+            self._log_thread = threading.Thread(target=self._drain_log_queue, name="telemetry-writer", daemon=True)
+            self._log_thread.start()
+            # The writer is a daemon thread; make sure queued entries reach the
+            # file even if the caller never calls close()
+            atexit.register(self.close)
     
     def generate(
         self,
@@ -62,25 +117,20 @@ class LLMMonitor:
         Returns:
             LLMResponse from the provider
         """
-        request_id = str(uuid.uuid4())
+        request_id = f"{self._id_prefix}{next(self._id_counter):012x}"
         start_time = time.time()
+        start_ns = time.perf_counter_ns()
         
         # Select provider (with failover)
-        selected_provider_id = self._select_provider(provider)
+        # try_acquire() may claim a half-open probe slot, so it is asked
+        # exactly once per provider here and not re-checked afterwards
+        selection = self._select_provider(provider, now=start_time)
+        if selection is None:
+            raise Exception("All providers are unavailable (circuit breakers open)")
+        selected_provider_id, probe = selection
         provider_instance = self.providers[selected_provider_id]
         circuit_breaker = self.circuit_breakers[selected_provider_id]
         
-        # Check circuit breaker
-        if not circuit_breaker.can_attempt():
-            # Try failover
-            failover_provider = self._get_failover_provider(selected_provider_id)
-            if failover_provider:
-                selected_provider_id = failover_provider
-                provider_instance = self.providers[selected_provider_id]
-                circuit_breaker = self.circuit_breakers[selected_provider_id]
-            else:
-                raise Exception("All providers are unavailable (circuit breakers open)")
-        
         # Make the API call
         error = None
         response = None
@@ -89,15 +139,24 @@ class LLMMonitor:
         try:
             response = provider_instance.generate(prompt, system_prompt)
             success = True
-            circuit_breaker.record_success()
         except Exception as e:
             error = str(e)
-            circuit_breaker.record_failure()
             raise
         
         finally:
-            # Calculate metrics
-            latency_ms = (time.time() - start_time) * 1000
+            # One wall-clock reading shared by the breaker and metrics
+            end_time = time.time()
+            if success:
+                circuit_breaker.record_success(probe)
+            elif error is not None:
+                circuit_breaker.record_failure(end_time, probe)
+            elif probe:
+                # Interrupted (KeyboardInterrupt, cancellation), not a provider
+                # failure; just hand the recovery probe slot back
+                circuit_breaker.release_probe()
+            
+            # Calculate metrics (latency from the monotonic high-resolution clock)
+            latency_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
             
             # Calculate cost
             cost = self._calculate_cost(selected_provider_id, response.input_tokens if response else 0, 
@@ -115,6 +174,7 @@ class LLMMonitor:
                 cost_usd=cost,
                 success=success,
                 error=error,
+                timestamp=end_time,
                 feature_version=feature_version,
                 prompt_version=prompt_version,
                 experiment_id=experiment_id,
@@ -129,47 +189,92 @@ class LLMMonitor:
         
         return response
     
-    def _select_provider(self, preferred: Optional[str] = None) -> str:
-        """Select a provider, considering circuit breakers."""
+    async def generate_async(self, prompt: str, **kwargs) -> LLMResponse:
+        """
+        Async variant of generate(), taking the same arguments.
+        
+        The provider call blocks, so it runs in a worker thread; this lets
+        independent requests overlap their network waits via asyncio.gather.
+        """
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+    
+    def _select_provider(self, preferred: Optional[str] = None,
+                         now: Optional[float] = None) -> Optional[Tuple[str, bool]]:
+        """
+        Select a provider, considering circuit breakers.
+        
+        Returns:
+            (provider_id, probe) where probe says whether the request is that
+            breaker's half-open recovery probe, or None if all are down
+        """
         if preferred and preferred in self.providers:
-            if self.circuit_breakers[preferred].can_attempt():
-                return preferred
+            admission = self.circuit_breakers[preferred].try_acquire(now)
+            if admission:
+                return preferred, admission is Admission.PROBE
+            
+            # Preferred provider is down, try failover
+            return self._get_failover_provider(preferred, now)
         
-        # Find first available provider
-        for provider_id, cb in self.circuit_breakers.items():
-            if cb.can_attempt():
-                return provider_id
+        # First provider whose circuit is closed (lowest set bit)
+        mask = self._available_mask
+        first_closed = (mask & -mask).bit_length() - 1 if mask else len(self._provider_list)
         
-        # If all are down, return preferred or first one anyway
-        return preferred or list(self.providers.keys())[0]
-    
-    def _get_failover_provider(self, current_provider: str) -> Optional[str]:
-        """Get a failover provider if current one is down."""
-        providers = list(self.providers.keys())
-        providers.remove(current_provider)
+        # Providers ahead of it keep their priority: one whose recovery
+        # timeout has passed still gets its probe
+        for provider_id in self._provider_list[:first_closed]:
+            admission = self.circuit_breakers[provider_id].try_acquire(now)
+            if admission:
+                return provider_id, admission is Admission.PROBE
         
-        for provider_id in providers:
-            if self.circuit_breakers[provider_id].can_attempt():
-                return provider_id
+        # The mask is only a hint: the chosen provider may have opened since it
+        # was read, so it is admitted by its breaker too, and on refusal the
+        # providers after it are tried in order
+        for provider_id in self._provider_list[first_closed:]:
+            admission = self.circuit_breakers[provider_id].try_acquire(now)
+            if admission:
+                return provider_id, admission is Admission.PROBE
+        
+        return None
+    
+    def _on_breaker_state_change(self, bit: int, state: CircuitState):
+        """Keep the closed-circuit bitmap in sync with a breaker's state."""
+        with self._mask_lock:
+            if state is CircuitState.CLOSED:
+                self._available_mask |= bit
+            else:
+                self._available_mask &= ~bit
+    
+    def _get_failover_provider(self, current_provider: str,
+                               now: Optional[float] = None) -> Optional[Tuple[str, bool]]:
+        """Get a failover provider (and probe flag) if current one is down."""
+        for provider_id, cb in self.circuit_breakers.items():
+            if provider_id == current_provider:
+                continue
+            admission = cb.try_acquire(now)
+            if admission:
+                return provider_id, admission is Admission.PROBE
         
         return None
     
     def _calculate_cost(self, provider_id: str, input_tokens: int, output_tokens: int) -> float:
         """Calculate cost based on provider pricing."""
-        provider = self.providers[provider_id]
-        
-        if hasattr(provider, 'cost_per_1k_input') and hasattr(provider, 'cost_per_1k_output'):
-            input_cost = (input_tokens / 1000) * provider.cost_per_1k_input
-            output_cost = (output_tokens / 1000) * provider.cost_per_1k_output
-            return input_cost + output_cost
-        
-        return 0.0
+        input_rate, output_rate = self._cost_rates[provider_id]
+        return input_tokens * input_rate + output_tokens * output_rate
     
     def _log_telemetry(self, metrics: RequestMetrics, prompt: str, 
                       system_prompt: Optional[str], response: Optional[LLMResponse]):
         """Log structured telemetry data."""
+        # Nothing consumes the entry without a log file or an in-memory buffer
+        if self._log_fh is None and self.log_buffer.maxlen == 0:
+            return
+        
+        now_s = int(metrics.timestamp)
+        ts_cache = self._ts_cache
+        if ts_cache[0] != now_s:
+            ts_cache = self._ts_cache = (now_s, datetime.utcfromtimestamp(now_s).isoformat())
+        
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": ts_cache[1],
             "request_id": metrics.request_id,
             "provider": metrics.provider,
             "model": metrics.model,
@@ -196,10 +301,71 @@ class LLMMonitor:
         # Add to buffer
         self.log_buffer.append(log_entry)
         
-        # Write to file if configured
-        if self.log_file:
-            with open(self.log_file, 'a') as f:
-                f.write(json.dumps(log_entry) + '\n')
+        # Hand off to the writer thread if configured
+        if self._log_fh is not None:
+            self._log_queue.put(log_entry)
+    
+    def _drain_log_queue(self):
+        """Write queued telemetry entries to the log file in batches."""
+        stop = False
+        while not stop:
+            entry = self._log_queue.get()
+            batch = []
+            while True:
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+                if len(batch) >= 100:
+                    break
+                try:
+                    entry = self._log_queue.get_nowait()
+                except queue.Empty:
+                    break
+            
+            try:
+                if orjson is not None:
+                    data = b''.join(orjson.dumps(entry) + b'\n' for entry in batch)
+                else:
+                    # Same compact UTF-8 output as orjson, whichever encoder runs
+                    data = ''.join(
+                        json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + '\n'
+                        for entry in batch
+                    ).encode('utf-8')
+                self._log_fh.write(data)
+                # Only flush once the backlog is drained; under load the OS write is
+                # amortized over many batches
+                if stop or self._log_queue.empty():
+                    self._log_fh.flush()
+            except Exception:
+                # Keep the writer alive; a dead thread would leave flush() and
+                # a full queue blocked forever
+                self.telemetry_write_errors += len(batch)
+                logger.exception("Failed to write %d telemetry entries to %s", len(batch), self.log_file)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._log_queue.task_done()
+    
+    def flush(self):
+        """Block until queued telemetry has been written to the log file."""
+        if self._log_thread is not None and self._log_thread.is_alive():
+            self._log_queue.join()
+    
+    def close(self):
+        """
+        Write out queued telemetry, stop the writer thread and close the log file.
+        
+        Requests made after close() still record metrics but are no longer
+        written to the log file.
+        """
+        if self._log_fh is None:
+            return
+        
+        self._log_queue.put(_STOP)
+        self._log_thread.join()
+        log_fh, self._log_fh = self._log_fh, None
+        log_fh.close()
+        atexit.unregister(self.close)
     
     def get_stats(self) -> Dict[str, Any]:
         """Get comprehensive statistics."""
@@ -207,6 +373,7 @@ class LLMMonitor:
             "providers": self.metrics.get_all_stats(),
             "total_requests": self.metrics.get_total_requests(),
             "total_cost_usd": round(self.metrics.get_total_cost(), 4),
+            "telemetry_write_errors": self.telemetry_write_errors,
             "circuit_breakers": {
                 provider_id: cb.get_stats()
                 for provider_id, cb in self.circuit_breakers.items()
@@ -217,31 +384,36 @@ class LLMMonitor:
         """Print statistics in a readable format."""
         stats = self.get_stats()
         
-        print("\n" + "="*60)
-        print("LLM MONITORING STATISTICS")
-        print("="*60)
+        # Build the report in memory and emit it with a single write
+        buf = io.StringIO()
+        out = functools.partial(print, file=buf)
+        
+        out("\n" + "="*60)
+        out("LLM MONITORING STATISTICS")
+        out("="*60)
         
-        print(f"\nTotal Requests: {stats['total_requests']}")
-        print(f"Total Cost: ${stats['total_cost_usd']:.4f}")
+        out(f"\nTotal Requests: {stats['total_requests']}")
+        out(f"Total Cost: ${stats['total_cost_usd']:.4f}")
         
-        print("\nProvider Statistics:")
+        out("\nProvider Statistics:")
         for provider_id, provider_stats in stats['providers'].items():
-            print(f"\n  {provider_id.upper()}:")
-            print(f"    Requests: {provider_stats['total_requests']}")
-            print(f"    Success Rate: {(1 - provider_stats['error_rate']) * 100:.1f}%")
-            print(f"    Total Tokens: {provider_stats['total_tokens']:,}")
-            print(f"    Total Cost: ${provider_stats['total_cost']:.4f}")
+            out(f"\n  {provider_id.upper()}:")
+            out(f"    Requests: {provider_stats['total_requests']}")
+            out(f"    Success Rate: {(1 - provider_stats['error_rate']) * 100:.1f}%")
+            out(f"    Total Tokens: {provider_stats['total_tokens']:,}")
+            out(f"    Total Cost: ${provider_stats['total_cost']:.4f}")
             if provider_stats['total_requests'] > 0:
-                print(f"    Latency - P50: {provider_stats['latency_p50']:.0f}ms, "
-                      f"P95: {provider_stats['latency_p95']:.0f}ms, "
-                      f"P99: {provider_stats['latency_p99']:.0f}ms")
+                out(f"    Latency - P50: {provider_stats['latency_p50']:.0f}ms, "
+                    f"P95: {provider_stats['latency_p95']:.0f}ms, "
+                    f"P99: {provider_stats['latency_p99']:.0f}ms")
         
-        print("\nCircuit Breaker States:")
+        out("\nCircuit Breaker States:")
         for provider_id, cb_stats in stats['circuit_breakers'].items():
             state_icon = "[OK]" if cb_stats['state'] == 'closed' else "[DOWN]" if cb_stats['state'] == 'open' else "[TEST]"
-            print(f"  {provider_id}: {state_icon} {cb_stats['state']} "
-                  f"(Failures: {cb_stats['failure_count']}, "
-                  f"Error Rate: {cb_stats['error_rate']*100:.1f}%)")
+            out(f"  {provider_id}: {state_icon} {cb_stats['state']} "
+                f"(Failures: {cb_stats['failure_count']}, "
+                f"Error Rate: {cb_stats['error_rate']*100:.1f}%)")
         
-        print("="*60 + "\n")
+        out("="*60 + "\n")
+        sys.stdout.write(buf.getvalue())
 
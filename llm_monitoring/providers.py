@@ -23,11 +23,14 @@ class LLMResponse:
 class MockLLMProvider:
     """Base class for mock LLM providers."""
     
-    def __init__(self, provider_id: str, model: str, base_latency_ms: float = 1000):
+    def __init__(self, provider_id: str, model: str, base_latency_ms: float = 1000,
+                 simulate_latency: bool = True):
         self.provider_id = provider_id
         self.model = model
         self.base_latency_ms = base_latency_ms
         self.failure_rate = 0.0  # Can be set to simulate failures
+        self.simulate_latency = simulate_latency  # Disable to benchmark the monitor itself
+        self._response_prefix = f"Mock response from {provider_id} ({model}) for: "
         
     def generate(self, prompt: str, system_prompt: Optional[str] = None) -> LLMResponse:
         """
@@ -42,18 +45,18 @@ class MockLLMProvider:
         """
         # Simulate network latency (base + random variation)
         latency = self.base_latency_ms + random.uniform(-200, 500)
-        time.sleep(latency / 1000)  # Convert to seconds
+        if self.simulate_latency:
+            time.sleep(latency / 1000)  # Convert to seconds
         
         # Simulate occasional failures
         if random.random() < self.failure_rate:
             raise Exception(f"{self.provider_id} API error: Service unavailable")
         
         # Estimate tokens (rough approximation: 1 token ≈ 4 characters)
-        input_text = (system_prompt or "") + prompt
-        input_tokens = len(input_text) // 4
+        input_tokens = (len(system_prompt or "") + len(prompt)) // 4
         
         # Generate mock response
-        response_text = f"Mock response from {self.provider_id} ({self.model}) for: {prompt[:50]}..."
+        response_text = self._response_prefix + prompt[:50] + "..."
         output_tokens = len(response_text) // 4
         
         return LLMResponse(
@@ -67,22 +70,24 @@ class MockLLMProvider:
 
 
 class MockOpenAIProvider(MockLLMProvider):
-    def __init__(self):
+    def __init__(self, simulate_latency: bool = True):
         super().__init__(
             provider_id="openai",
             model="gpt-4",
-            base_latency_ms=1200  # Slightly slower
+            base_latency_ms=1200,  # Slightly slower
+            simulate_latency=simulate_latency
         )
         self.cost_per_1k_input = 0.03
         self.cost_per_1k_output = 0.06
 
 
 class MockAnthropicProvider(MockLLMProvider):
-    def __init__(self):
+    def __init__(self, simulate_latency: bool = True):
         super().__init__(
             provider_id="anthropic",
             model="claude-3-5-sonnet-20241022",
-            base_latency_ms=800  # Faster
+            base_latency_ms=800,  # Faster
+            simulate_latency=simulate_latency
         )
         self.cost_per_1k_input = 0.003
         self.cost_per_1k_output = 0.015